@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from datetime import datetime, timezone
 from telegram import Update
@@ -8,27 +9,54 @@ from db import init_db, set_budget, get_budgets, list_categories
 from extractor import extract_from_receipt_image
 from gmail_agent import pull_and_process_emails
 from expense_agent import run_expense_agent
-from reports import monthly_text_summary, plot_weekly_spend, plot_vendor_top
+from reports import build_monthly_report
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# ---------------- Background task helpers ----------------
+
+def _fire_and_forget(coro):
+    """Run coro as a background task, logging any exception it raises."""
+    task = asyncio.create_task(coro)
+
+    def _log_failure(t):
+        if not t.cancelled() and t.exception():
+            logger.error("Background task failed", exc_info=t.exception())
+
+    task.add_done_callback(_log_failure)
+    return task
+
+
+def _chat_lock(context: ContextTypes.DEFAULT_TYPE) -> asyncio.Lock:
+    """Per-chat lock so background work stays ordered within one chat."""
+    lock = context.chat_data.get("_lock")
+    if lock is None:
+        lock = context.chat_data["_lock"] = asyncio.Lock()
+    return lock
+
+
 # ---------------- Message Handler (Agent-based) ----------------
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle all text messages using the expense agent."""
-    user_message = update.message.text
+    # Run the agent in the background so a slow LLM call in one chat
+    # doesn't block the polling loop for everyone else.
+    _fire_and_forget(_handle_message_task(update, context, update.message.text))
 
-    try:
-        response = await run_expense_agent(user_message)
-        await update.message.reply_text(response)
-    except Exception as e:
-        logger.exception("Agent error")
-        await update.message.reply_text(
-            "Sorry, I encountered an error processing your message. Please try again."
-        )
+
+async def _handle_message_task(update: Update, context: ContextTypes.DEFAULT_TYPE, user_message: str):
+    async with _chat_lock(context):
+        try:
+            response = await run_expense_agent(user_message)
+            await update.message.reply_text(response)
+        except Exception:
+            logger.exception("Agent error")
+            await update.message.reply_text(
+                "Sorry, I encountered an error processing your message. Please try again."
+            )
 
 
 # ---------------- Command Handlers ----------------
@@ -69,42 +97,54 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def pull_gmail(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Pull emails from Gmail and process with AI classification."""
     await update.message.reply_text("Pulling new emails from Gmail...")
+    _fire_and_forget(_pull_gmail_task(update, context))
 
-    try:
-        result = await pull_and_process_emails()
-        await update.message.reply_text(
-            f"Processed {result['emails_checked']} emails.\n"
-            f"Found {result['expenses_found']} expense-related emails.\n"
-            f"Saved {result['expenses_saved']} new expenses."
-        )
-    except FileNotFoundError as e:
-        await update.message.reply_text(f"Gmail setup required: {e}")
-    except Exception as e:
-        logger.exception("Gmail pull failed")
-        await update.message.reply_text(f"Failed to pull Gmail: {e}")
+
+async def _pull_gmail_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async with _chat_lock(context):
+        try:
+            result = await pull_and_process_emails()
+            await update.message.reply_text(
+                f"Processed {result['emails_checked']} emails.\n"
+                f"Found {result['expenses_found']} expense-related emails.\n"
+                f"Saved {result['expenses_saved']} new expenses."
+            )
+        except FileNotFoundError as e:
+            await update.message.reply_text(f"Gmail setup required: {e}")
+        except Exception as e:
+            logger.exception("Gmail pull failed")
+            await update.message.reply_text(f"Failed to pull Gmail: {e}")
 
 
 async def image_expense(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle receipt image uploads."""
-    photo = update.message.photo[-1]
-    file = await photo.get_file()
-    img_bytes = await file.download_as_bytearray()
+    await update.message.reply_text("Processing receipt...")
+    _fire_and_forget(_image_expense_task(update, context))
 
-    try:
-        data = extract_from_receipt_image(img_bytes)
-    except Exception as e:
-        logger.exception("Receipt extraction failed")
-        await update.message.reply_text("Couldn't extract receipt. Try a clearer photo.")
-        return
 
-    if not data or not data.get("amount"):
-        await update.message.reply_text("No amount found on the receipt.")
-        return
+async def _image_expense_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async with _chat_lock(context):
+        photo = update.message.photo[-1]
+        file = await photo.get_file()
+        img_bytes = await file.download_as_bytearray()
 
-    # Use agent to record the expense
-    expense_desc = f"Receipt: {data.get('vendor', 'Unknown')} ${data.get('amount')} {data.get('category', '')}"
-    response = await run_expense_agent(expense_desc)
-    await update.message.reply_text(response)
+        try:
+            # OCR plus the extraction API call are synchronous and take
+            # seconds; run them in a worker thread off the event loop
+            data = await asyncio.to_thread(extract_from_receipt_image, img_bytes)
+        except Exception:
+            logger.exception("Receipt extraction failed")
+            await update.message.reply_text("Couldn't extract receipt. Try a clearer photo.")
+            return
+
+        if not data or not data.get("amount"):
+            await update.message.reply_text("No amount found on the receipt.")
+            return
+
+        # Use agent to record the expense
+        expense_desc = f"Receipt: {data.get('vendor', 'Unknown')} ${data.get('amount')} {data.get('category', '')}"
+        response = await run_expense_agent(expense_desc)
+        await update.message.reply_text(response)
 
 
 async def set_budget_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -159,21 +199,22 @@ async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         year, month = now.year, now.month
 
     await update.message.reply_text(f"Generating report for {year}-{month:02d}...")
+    _fire_and_forget(_report_task(update, context, year, month))
+
 
-    text = monthly_text_summary(year, month)
-    await update.message.reply_text(text)
+async def _report_task(update: Update, context: ContextTypes.DEFAULT_TYPE, year: int, month: int):
+    async with _chat_lock(context):
+        # Renders both charts in parallel worker threads off the event loop
+        text, weekly_bio, vendor_bio = await asyncio.to_thread(build_monthly_report, year, month)
+        await update.message.reply_text(text)
 
-    # Weekly chart
-    weekly_bio = plot_weekly_spend(year, month)
-    if weekly_bio:
-        weekly_bio.seek(0)
-        await update.message.reply_photo(photo=weekly_bio, caption="Weekly spending")
+        if weekly_bio:
+            weekly_bio.seek(0)
+            await update.message.reply_photo(photo=weekly_bio, caption="Weekly spending")
 
-    # Vendor chart
-    vendor_bio = plot_vendor_top(year, month, top_n=10)
-    if vendor_bio:
-        vendor_bio.seek(0)
-        await update.message.reply_photo(photo=vendor_bio, caption="Top vendors")
+        if vendor_bio:
+            vendor_bio.seek(0)
+            await update.message.reply_photo(photo=vendor_bio, caption="Top vendors")
 
 
 # ---------------- Main ----------------
@@ -0,0 +1,23 @@
+"""
+Shared API clients.
+
+Each module used to build its own OpenAI client, so each got its own
+httpx pool and paid a fresh TCP+TLS handshake. Importing the clients
+from here means every caller in the process reuses one keep-alive pool.
+"""
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+import config
+
+_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+
+openai_client = OpenAI(
+    api_key=config.OPENAI_API_KEY,
+    http_client=httpx.Client(limits=_LIMITS)
+)
+
+async_openai_client = AsyncOpenAI(
+    api_key=config.OPENAI_API_KEY,
+    http_client=httpx.AsyncClient(limits=_LIMITS)
+)
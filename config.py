@@ -1,15 +1,27 @@
-import yaml
+from functools import lru_cache
 from pathlib import Path
 
-# Load config from YAML
+import yaml
+
+try:
+    # libyaml C loader; ~3-5x faster than the pure-Python SafeLoader
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
+
 _config_path = Path(__file__).parent / "config.yaml"
-with open(_config_path) as f:
-    _config = yaml.safe_load(f)
 
-TELEGRAM_TOKEN = _config["telegram_token"]
-OPENAI_API_KEY = _config["openai_api_key"]
 
-GMAIL_CREDENTIALS_FILE = _config.get("gmail_credentials_file", "credentials.json")
-GMAIL_TOKEN_FILE = _config.get("gmail_token_file", "token.json")
+@lru_cache(maxsize=1)
+def _cfg() -> dict:
+    with open(_config_path) as f:
+        return yaml.load(f, Loader=_Loader)
+
+
+TELEGRAM_TOKEN = _cfg()["telegram_token"]
+OPENAI_API_KEY = _cfg()["openai_api_key"]
+
+GMAIL_CREDENTIALS_FILE = _cfg().get("gmail_credentials_file", "credentials.json")
+GMAIL_TOKEN_FILE = _cfg().get("gmail_token_file", "token.json")
 
-DATABASE_PATH = _config.get("database_path", "expenses.db")
+DATABASE_PATH = _cfg().get("database_path", "expenses.db")
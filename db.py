@@ -1,13 +1,68 @@
 import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Dict
 
 import config
 
 DB_PATH = config.DATABASE_PATH
 
+# One cached connection per thread. Opening a connection per call pays
+# journal/fsync setup every time, which dominates on hot paths like the
+# Gmail pull loop.
+_local = threading.local()
+
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+# Aggregate query cache. Keys include _expenses_version, which is bumped on
+# every expense write, so stale entries simply stop being hit.
+_expenses_version = 0
+_AGG_CACHE = OrderedDict()
+_AGG_CACHE_MAX = 128
+
+
+def _bump_expenses_version():
+    global _expenses_version
+    _expenses_version += 1
+
+
+def expenses_version() -> int:
+    """Counter bumped on every expense write; usable as a cache key."""
+    return _expenses_version
+
+
+def _agg_cache_get(key):
+    value = _AGG_CACHE.get(key)
+    if value is not None:
+        _AGG_CACHE.move_to_end(key)
+    return value
+
+
+def _agg_cache_put(key, value):
+    _AGG_CACHE[key] = value
+    _AGG_CACHE.move_to_end(key)
+    while len(_AGG_CACHE) > _AGG_CACHE_MAX:
+        _AGG_CACHE.popitem(last=False)
+
 
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        # isolation_level=None -> autocommit; multi-statement ops use
+        # explicit BEGIN/COMMIT where needed.
+        conn = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+    return conn
 
 
 def init_db():
@@ -44,8 +99,19 @@ def init_db():
         last_history_id TEXT
     )
     """)
-    conn.commit()
-    conn.close()
+    # cached LLM responses keyed by prompt hash
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        hash TEXT PRIMARY KEY,
+        response TEXT,
+        ts TEXT
+    )
+    """)
+    # Composite indexes for the date-ranged report/aggregate queries.
+    # The UNIQUE constraint on email_id already indexes the dedupe lookups.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date_category ON expenses(date, category, amount)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date_vendor ON expenses(date, vendor, amount)")
+    c.execute("ANALYZE")
 
 
 def save_expense(exp: Dict):
@@ -64,8 +130,49 @@ def save_expense(exp: Dict):
         exp.get("notes"),
         exp.get("email_id")
     ))
-    conn.commit()
-    conn.close()
+    _list_categories_cached.cache_clear()
+    _bump_expenses_version()
+
+
+def save_expenses_bulk(exps: List[Dict]) -> int:
+    """Insert many expenses in a single transaction (one fsync for the batch).
+
+    Duplicate email_ids are skipped via INSERT OR IGNORE, matching the
+    old one-insert-per-email behaviour. Returns the number of rows
+    actually inserted.
+    """
+    if not exps:
+        return 0
+    conn = get_conn()
+    c = conn.cursor()
+    rows = [
+        (
+            exp.get("date"),
+            exp.get("vendor"),
+            float(exp.get("amount") or 0),
+            exp.get("currency"),
+            exp.get("category"),
+            exp.get("source"),
+            exp.get("notes"),
+            exp.get("email_id")
+        )
+        for exp in exps
+    ]
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        c.executemany("""
+        INSERT OR IGNORE INTO expenses (date, vendor, amount, currency, category, source, notes, email_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        saved = c.rowcount
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+    if saved:
+        _list_categories_cached.cache_clear()
+        _bump_expenses_version()
+    return saved
 
 
 def set_budget(category: str, amount: float, period: str = "monthly"):
@@ -75,26 +182,38 @@ def set_budget(category: str, amount: float, period: str = "monthly"):
     INSERT INTO budgets (category, amount, period) VALUES (?, ?, ?)
     ON CONFLICT(category) DO UPDATE SET amount=excluded.amount, period=excluded.period
     """, (category, amount, period))
-    conn.commit()
-    conn.close()
+    _get_budgets_cached.cache_clear()
+    get_budget_index.cache_clear()
 
 
-def get_budgets() -> List[Dict]:
+@lru_cache(maxsize=1)
+def _get_budgets_cached() -> tuple:
     conn = get_conn()
     c = conn.cursor()
     c.execute("SELECT category, amount, period FROM budgets")
-    rows = c.fetchall()
-    conn.close()
-    return [{"category": r[0], "amount": r[1], "period": r[2]} for r in rows]
+    return tuple(dict(r) for r in c)
 
 
-def list_categories() -> List[str]:
+def get_budgets() -> List[Dict]:
+    return list(_get_budgets_cached())
+
+
+@lru_cache(maxsize=1)
+def get_budget_index() -> Dict[str, Dict]:
+    """Budgets keyed by category; cached until set_budget invalidates it."""
+    return {b["category"]: b for b in _get_budgets_cached()}
+
+
+@lru_cache(maxsize=1)
+def _list_categories_cached() -> tuple:
     conn = get_conn()
     c = conn.cursor()
     c.execute("SELECT DISTINCT category FROM expenses WHERE category IS NOT NULL")
-    rows = c.fetchall()
-    conn.close()
-    return [r[0] for r in rows if r[0]]
+    return tuple(r[0] for r in c if r[0])
+
+
+def list_categories() -> List[str]:
+    return list(_list_categories_cached())
 
 
 def get_expenses_between(start_date: str, end_date: str) -> List[Dict]:
@@ -106,48 +225,159 @@ def get_expenses_between(start_date: str, end_date: str) -> List[Dict]:
     WHERE date BETWEEN ? AND ?
     ORDER BY date ASC
     """, (start_date, end_date))
-    rows = c.fetchall()
-    conn.close()
-    return [
-        {"id": r[0], "date": r[1], "vendor": r[2], "amount": r[3],
-         "currency": r[4], "category": r[5], "source": r[6], "notes": r[7]}
-        for r in rows
-    ]
+    return [dict(r) for r in c]
+
+
+def get_recent_expenses(limit: int = 10) -> List[Dict]:
+    """Fetch the most recent expenses, newest first, bounded in SQL."""
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("""
+    SELECT id, date, vendor, amount, currency, category, source, notes
+    FROM expenses
+    ORDER BY date DESC, id DESC
+    LIMIT ?
+    """, (limit,))
+    return [dict(r) for r in c]
+
+
+def weekly_totals(start_date: str, end_date: str) -> List[Dict]:
+    """Spend per week (Monday-anchored) in a date range, aggregated in SQL."""
+    conn = get_conn()
+    c = conn.cursor()
+    # date(date, 'weekday 0', '-6 days') maps any day to the Monday of
+    # its week, so the GROUP BY buckets by week without touching Python
+    c.execute("""
+    SELECT date(date, 'weekday 0', '-6 days') AS week_start, SUM(amount) AS total
+    FROM expenses
+    WHERE date BETWEEN ? AND ?
+    GROUP BY week_start
+    ORDER BY week_start
+    """, (start_date, end_date))
+    return [dict(r) for r in c]
+
+
+def budget_status(start_date: str, end_date: str) -> List[Dict]:
+    """Budgets joined with period spending, plus spending with no budget.
+
+    One query instead of fetching budgets and aggregates separately and
+    merging in Python. Rows are {"category", "budget", "spent"} with
+    budget NULL for unbudgeted categories.
+    """
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("""
+    WITH spent AS (
+        SELECT category, SUM(amount) AS total
+        FROM expenses
+        WHERE date BETWEEN ? AND ?
+        GROUP BY category
+    )
+    SELECT b.category AS category, b.amount AS budget, COALESCE(s.total, 0) AS spent
+    FROM budgets b
+    LEFT JOIN spent s ON s.category = b.category
+    UNION ALL
+    SELECT COALESCE(s.category, 'Uncategorized') AS category, NULL AS budget, s.total AS spent
+    FROM spent s
+    WHERE s.category IS NULL OR s.category NOT IN (SELECT category FROM budgets)
+    """, (start_date, end_date))
+    return [dict(r) for r in c]
+
+
+def get_category_summary(category: str, start_date: str, end_date: str, limit: int = 10):
+    """Total, count and the last `limit` expenses for one category.
+
+    Returns (total, count, rows) computed in SQL on one connection, so
+    callers that only need the totals never transfer the full row set.
+    """
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("""
+    SELECT COALESCE(SUM(amount), 0) AS total, COUNT(*) AS count
+    FROM expenses
+    WHERE date BETWEEN ? AND ? AND lower(category) = lower(?)
+    """, (start_date, end_date, category))
+    row = c.fetchone()
+    total, count = float(row["total"]), row["count"]
+
+    c.execute("""
+    SELECT id, date, vendor, amount, currency, category, source, notes
+    FROM expenses
+    WHERE date BETWEEN ? AND ? AND lower(category) = lower(?)
+    ORDER BY date DESC, id DESC
+    LIMIT ?
+    """, (start_date, end_date, category, limit))
+    rows = [dict(r) for r in c]
+    rows.reverse()  # oldest first
+    return total, count, rows
 
 
 def aggregate_by_field(start_date: str, end_date: str, field: str = "category"):
     if field not in ("category", "vendor"):
         field = "category"
+    key = (start_date, end_date, field, _expenses_version)
+    cached = _agg_cache_get(key)
+    if cached is not None:
+        return cached
     conn = get_conn()
     c = conn.cursor()
     q = f"""
-    SELECT {field}, SUM(amount) as total, COUNT(*) as count
+    SELECT {field} AS field, SUM(amount) AS total, COUNT(*) AS count
     FROM expenses
     WHERE date BETWEEN ? AND ?
     GROUP BY {field}
     ORDER BY total DESC
     """
     c.execute(q, (start_date, end_date))
-    rows = c.fetchall()
-    conn.close()
-    return [{"field": r[0] or "Uncategorized", "total": r[1], "count": r[2]} for r in rows]
+    result = [{"field": r["field"] or "Uncategorized", "total": r["total"], "count": r["count"]} for r in c]
+    _agg_cache_put(key, result)
+    return result
+
+
+def top_by_field(start_date: str, end_date: str, field: str = "vendor", limit: int = 10):
+    """Top N field values by total spend in a range, computed in SQL."""
+    if field not in ("category", "vendor"):
+        field = "vendor"
+    key = (start_date, end_date, f"top:{field}:{limit}", _expenses_version)
+    cached = _agg_cache_get(key)
+    if cached is not None:
+        return cached
+    conn = get_conn()
+    c = conn.cursor()
+    q = f"""
+    SELECT {field} AS field, SUM(amount) AS total
+    FROM expenses
+    WHERE date BETWEEN ? AND ? AND {field} IS NOT NULL AND {field} != ''
+    GROUP BY {field}
+    ORDER BY total DESC
+    LIMIT ?
+    """
+    c.execute(q, (start_date, end_date, limit))
+    result = [dict(r) for r in c]
+    _agg_cache_put(key, result)
+    return result
 
 
 def total_spent(start_date: str, end_date: str) -> float:
+    key = (start_date, end_date, "total", _expenses_version)
+    cached = _agg_cache_get(key)
+    if cached is not None:
+        return cached
     conn = get_conn()
     c = conn.cursor()
     c.execute("SELECT SUM(amount) FROM expenses WHERE date BETWEEN ? AND ?", (start_date, end_date))
     row = c.fetchone()
-    conn.close()
-    return float(row[0] or 0)
+    result = float(row[0] or 0)
+    _agg_cache_put(key, result)
+    return result
 
 
 def assign_category_to_expense(expense_id: int, category: str):
     conn = get_conn()
     c = conn.cursor()
     c.execute("UPDATE expenses SET category = ? WHERE id = ?", (category, expense_id))
-    conn.commit()
-    conn.close()
+    _list_categories_cached.cache_clear()
+    _bump_expenses_version()
 
 
 def get_sync_state() -> Dict:
@@ -156,7 +386,6 @@ def get_sync_state() -> Dict:
     c = conn.cursor()
     c.execute("SELECT last_sync_timestamp, last_history_id FROM sync_state WHERE id = 1")
     row = c.fetchone()
-    conn.close()
     if row:
         return {"last_sync_timestamp": row[0], "last_history_id": row[1]}
     return {"last_sync_timestamp": None, "last_history_id": None}
@@ -173,8 +402,40 @@ def set_sync_state(timestamp: str = None, history_id: str = None):
         last_sync_timestamp = COALESCE(excluded.last_sync_timestamp, last_sync_timestamp),
         last_history_id = COALESCE(excluded.last_history_id, last_history_id)
     """, (timestamp, history_id))
-    conn.commit()
-    conn.close()
+
+
+def existing_email_ids(email_ids: List[str]) -> set:
+    """Return the subset of email_ids that already have a saved expense."""
+    if not email_ids:
+        return set()
+    conn = get_conn()
+    c = conn.cursor()
+    seen = set()
+    # Chunk to stay under SQLite's bound-variable limit
+    for i in range(0, len(email_ids), 500):
+        chunk = email_ids[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        c.execute(f"SELECT email_id FROM expenses WHERE email_id IN ({placeholders})", chunk)
+        seen.update(r[0] for r in c)
+    return seen
+
+
+def get_llm_cache(key: str):
+    """Return the cached LLM response for a prompt hash, or None."""
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("SELECT response FROM llm_cache WHERE hash = ?", (key,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+
+def put_llm_cache(key: str, response: str):
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("""
+    INSERT OR REPLACE INTO llm_cache (hash, response, ts)
+    VALUES (?, ?, datetime('now'))
+    """, (key, response))
 
 
 def email_already_processed(email_id: str) -> bool:
@@ -183,5 +444,4 @@ def email_already_processed(email_id: str) -> bool:
     c = conn.cursor()
     c.execute("SELECT 1 FROM expenses WHERE email_id = ?", (email_id,))
     row = c.fetchone()
-    conn.close()
     return row is not None
@@ -9,8 +9,10 @@ from agents import Agent, Runner, function_tool
 
 import config
 from db import (
-    get_expenses_between, aggregate_by_field, total_spent,
-    get_budgets, save_expense, list_categories
+    aggregate_by_field, total_spent,
+    budget_status, save_expense, list_categories,
+    get_recent_expenses as db_get_recent_expenses,
+    get_category_summary
 )
 from reports import iso_first_last_of_month
 
@@ -53,35 +55,19 @@ def get_budget_status() -> str:
     """
     now = datetime.now(timezone.utc)
     start, end = iso_first_last_of_month(now.year, now.month)
-    by_category = aggregate_by_field(start, end, field="category")
-    budgets = get_budgets()
-
-    budget_map = {b["category"]: b["amount"] for b in budgets}
-    spent_map = {c["field"]: c["total"] for c in by_category}
 
     status = []
-    for category, budget in budget_map.items():
-        spent = spent_map.get(category, 0)
-        remaining = budget - spent
+    for row in budget_status(start, end):
+        budget = row["budget"]
+        remaining = budget - row["spent"] if budget is not None else None
         status.append({
-            "category": category,
+            "category": row["category"],
             "budget": budget,
-            "spent": round(spent, 2),
-            "remaining": round(remaining, 2),
-            "over_budget": remaining < 0
+            "spent": round(row["spent"], 2),
+            "remaining": round(remaining, 2) if remaining is not None else None,
+            "over_budget": remaining is not None and remaining < 0
         })
 
-    # Add categories with spending but no budget
-    for cat_data in by_category:
-        if cat_data["field"] not in budget_map:
-            status.append({
-                "category": cat_data["field"],
-                "budget": None,
-                "spent": round(cat_data["total"], 2),
-                "remaining": None,
-                "over_budget": False
-            })
-
     return json.dumps(status, indent=2)
 
 
@@ -93,12 +79,7 @@ def get_recent_expenses(limit: int = 10) -> str:
     Args:
         limit: Maximum number of expenses to return (default 10)
     """
-    now = datetime.now(timezone.utc)
-    start, end = iso_first_last_of_month(now.year, now.month)
-    expenses = get_expenses_between(start, end)
-
-    recent = expenses[-limit:] if len(expenses) > limit else expenses
-    recent.reverse()  # Most recent first
+    recent = db_get_recent_expenses(limit)  # Most recent first
 
     result = []
     for exp in recent:
@@ -128,22 +109,16 @@ def get_category_spending(category: str, year: int = None, month: int = None) ->
     month = month or now.month
 
     start, end = iso_first_last_of_month(year, month)
-    expenses = get_expenses_between(start, end)
-
-    # Filter by category (case-insensitive)
-    category_lower = category.lower()
-    filtered = [e for e in expenses if (e["category"] or "").lower() == category_lower]
-
-    total = sum(e["amount"] for e in filtered)
+    total, count, transactions = get_category_summary(category, start, end, limit=10)
 
     return json.dumps({
         "category": category,
         "period": f"{year}-{month:02d}",
         "total": round(total, 2),
-        "transaction_count": len(filtered),
+        "transaction_count": count,
         "transactions": [
             {"date": e["date"], "vendor": e["vendor"], "amount": e["amount"]}
-            for e in filtered[-10:]  # Last 10
+            for e in transactions
         ]
     }, indent=2)
 
@@ -1,11 +1,13 @@
 import json
 import re
 import io
-from openai import OpenAI
+import hashlib
 
-import config
+from clients import openai_client as client
+from db import get_llm_cache, put_llm_cache
 
-client = OpenAI(api_key=config.OPENAI_API_KEY)
+# Compiled once at import; hit on every fallback extraction
+_AMOUNT_RE = re.compile(r'([$€£])\s?(\d+(?:\.\d{1,2})?)')
 
 
 def extract_from_text(text: str) -> dict:
@@ -19,24 +21,27 @@ Text:
 
 Return ONLY valid JSON object.
 """
+    # Identical text (e.g. the same receipt sent twice) hits the on-disk
+    # cache instead of paying another API call.
+    cache_key = hashlib.blake2b(f"gpt-4o-mini|{prompt}".encode()).hexdigest()
     try:
+        cached = get_llm_cache(cache_key)
+        if cached is not None:
+            return json.loads(cached)
+
         resp = client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.0,
-            max_tokens=300
+            max_tokens=200,
+            response_format={"type": "json_object"}
         )
-        content = resp.choices[0].message.content.strip()
-
-        # Remove markdown code blocks if present
-        if content.startswith("```"):
-            content = re.sub(r'^```(?:json)?\n?', '', content)
-            content = re.sub(r'\n?```$', '', content)
-
+        content = resp.choices[0].message.content
         data = json.loads(content)
+        put_llm_cache(cache_key, content)
     except Exception:
         # Fallback: try to extract amount with regex
-        m = re.search(r'([$€£])\s?(\d+(?:\.\d{1,2})?)', text)
+        m = _AMOUNT_RE.search(text)
         amount = float(m.group(2)) if m else None
         data = {
             "date": "",
@@ -52,11 +57,16 @@ Return ONLY valid JSON object.
 def extract_from_receipt_image(image_bytes: bytes) -> dict:
     """Extract expense data from receipt image using OCR."""
     try:
-        from PIL import Image
+        from PIL import Image, ImageOps
         import pytesseract
 
         img = Image.open(io.BytesIO(image_bytes))
-        ocr_text = pytesseract.image_to_string(img)
+        # Tesseract time scales with pixel count; phone photos are far
+        # larger than OCR needs. Downscale, grayscale and boost contrast
+        # before running the fast LSTM engine.
+        img.thumbnail((1600, 1600), Image.LANCZOS)
+        img = ImageOps.autocontrast(img.convert('L'))
+        ocr_text = pytesseract.image_to_string(img, config='--oem 1 --psm 6', lang='eng')
         return extract_from_text(ocr_text)
     except Exception:
         # Fallback if OCR fails
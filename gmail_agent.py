@@ -2,11 +2,13 @@
 Gmail Agent - Pulls emails and uses AI to classify and extract expenses.
 """
 import os
+import re
 import json
 import base64
+import asyncio
+import hashlib
 from datetime import datetime, timezone
 from typing import List, Tuple, Optional
-from openai import OpenAI
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -14,13 +16,32 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
 import config
-from db import save_expense, get_sync_state, set_sync_state, email_already_processed
+from clients import async_openai_client as client
+from db import (
+    save_expenses_bulk, get_sync_state, set_sync_state, existing_email_ids,
+    get_llm_cache, put_llm_cache
+)
 
 # Gmail API scope
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
-# OpenAI client
-client = OpenAI(api_key=config.OPENAI_API_KEY)
+# Cap concurrent classification calls to stay within OpenAI rate limits
+CLASSIFY_CONCURRENCY = 8
+
+# Cheap keyword gate run before the LLM classifier. Obvious marketing mail
+# is dropped without an API call; anything ambiguous still goes to the model.
+_EXPENSE_HINT = re.compile(
+    r'(receipt|invoice|order confirmation|payment|charge|subscription).*?[\$€£]\s?\d',
+    re.IGNORECASE | re.DOTALL
+)
+_NON_EXPENSE = re.compile(r'unsubscribe|newsletter|promotion', re.IGNORECASE)
+_AMOUNT_TOKEN = re.compile(r'[\$€£]\s?\d')
+
+
+def probably_not_expense(subject: str, sender: str, body: str) -> bool:
+    """True for emails that are confidently not expenses (skip the LLM)."""
+    text = f"{subject} {sender} {body[:512]}"
+    return bool(_NON_EXPENSE.search(text)) and not _EXPENSE_HINT.search(text)
 
 
 def get_gmail_service():
@@ -51,75 +72,154 @@ def get_gmail_service():
 
 
 def extract_email_body(payload) -> str:
-    """Recursively extract plain text body from email payload."""
-    body = ""
-
-    if 'body' in payload and payload['body'].get('data'):
-        body = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8', errors='ignore')
-
-    if 'parts' in payload:
-        for part in payload['parts']:
-            mime_type = part.get('mimeType', '')
-            if mime_type == 'text/plain' and part['body'].get('data'):
-                body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-                break
-            elif mime_type.startswith('multipart/'):
-                body = extract_email_body(part)
-                if body:
-                    break
-
-    return body
-
-
-def fetch_new_emails(service, max_results: int = 50) -> List[dict]:
+    """Extract plain text body from email payload, preferring text/plain parts."""
+    # Iterative walk over the MIME tree; decode exactly one part. The first
+    # text/plain part wins so large HTML siblings are never base64-decoded.
+    stack = [payload]
+    fallback = None
+    while stack:
+        part = stack.pop()
+        data = part.get('body', {}).get('data')
+        if data:
+            if part.get('mimeType', '') == 'text/plain':
+                return base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+            if fallback is None:
+                fallback = data
+        stack.extend(part.get('parts', ()))
+
+    if fallback:
+        return base64.urlsafe_b64decode(fallback).decode('utf-8', errors='ignore')
+    return ""
+
+
+def _batch_get_messages(service, msg_ids: List[str], **get_kwargs) -> dict:
+    """Fetch messages by id via batched HTTP requests (100 calls per round-trip)."""
+    messages = {}
+
+    def _collect(request_id, response, exception):
+        if exception is None:
+            messages[request_id] = response
+
+    for i in range(0, len(msg_ids), 100):
+        batch = service.new_batch_http_request(callback=_collect)
+        for mid in msg_ids[i:i + 100]:
+            batch.add(
+                service.users().messages().get(userId='me', id=mid, **get_kwargs),
+                request_id=mid
+            )
+        batch.execute()
+
+    return messages
+
+
+def _header_values(msg) -> Tuple[str, str, str]:
+    """Pull (subject, sender, date) out of a message's payload headers."""
+    subject = ""
+    sender = ""
+    date = ""
+    for header in msg.get('payload', {}).get('headers', []):
+        name = header.get('name', '').lower()
+        if name == 'subject':
+            subject = header.get('value', '')
+        elif name == 'from':
+            sender = header.get('value', '')
+        elif name == 'date':
+            date = header.get('value', '')
+    return subject, sender, date
+
+
+def _history_message_ids(service, start_history_id: str, max_results: int) -> Tuple[List[str], Optional[str]]:
+    """List ids of messages added since start_history_id via history.list."""
+    ids = []
+    history_id = start_history_id
+    page_token = None
+    while True:
+        resp = service.users().history().list(
+            userId='me',
+            startHistoryId=start_history_id,
+            historyTypes=['messageAdded'],
+            pageToken=page_token
+        ).execute()
+        history_id = resp.get('historyId', history_id)
+        for record in resp.get('history', []):
+            for added in record.get('messagesAdded', []):
+                ids.append(added['message']['id'])
+        page_token = resp.get('nextPageToken')
+        if not page_token or len(ids) >= max_results:
+            break
+    return ids[:max_results], history_id
+
+
+def fetch_new_emails(service, max_results: int = 50) -> Tuple[List[dict], Optional[str]]:
     """
     Fetch new emails since last sync.
-    Returns list of email dicts with id, subject, sender, body, date.
+    Returns (emails, history_id): a list of email dicts with id, subject,
+    sender, body, date, and the Gmail history id to store for the next sync.
     """
     sync_state = get_sync_state()
-    last_timestamp = sync_state.get("last_sync_timestamp")
+    last_history_id = sync_state.get("last_history_id")
 
-    # Build query - get emails from last sync or last 7 days
-    if last_timestamp:
-        query = f"after:{last_timestamp[:10].replace('-', '/')}"
-    else:
-        query = "newer_than:7d"
+    # Incremental sync: history.list returns only messages added since the
+    # stored history id, instead of re-listing everything since a date.
+    msg_ids = None
+    new_history_id = None
+    if last_history_id:
+        try:
+            msg_ids, new_history_id = _history_message_ids(service, last_history_id, max_results)
+        except Exception:
+            msg_ids = None  # expired/invalid history id - fall back to query
 
-    results = service.users().messages().list(
-        userId='me',
-        q=query,
-        maxResults=max_results
-    ).execute()
+    if msg_ids is None:
+        # First run (or stale history id): query by date as before
+        last_timestamp = sync_state.get("last_sync_timestamp")
+        if last_timestamp:
+            query = f"after:{last_timestamp[:10].replace('-', '/')}"
+        else:
+            query = "newer_than:7d"
+
+        results = service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=max_results
+        ).execute()
+        msg_ids = [msg['id'] for msg in results.get('messages', [])]
+
+    # Skip already-processed emails before fetching anything; one IN-query
+    # instead of a SELECT per message id
+    seen = existing_email_ids(msg_ids)
+    new_ids = [mid for mid in msg_ids if mid not in seen]
+
+    # Pass 1: headers only. Metadata fetches are far cheaper (bytes and
+    # Gmail quota units) than full MIME trees, and most messages get
+    # rejected by the keyword gate on subject/sender alone.
+    meta_msgs = _batch_get_messages(
+        service, new_ids,
+        format='metadata', metadataHeaders=['Subject', 'From', 'Date']
+    )
+
+    candidates = []
+    for mid in new_ids:
+        meta = meta_msgs.get(mid)
+        if not meta:
+            continue
+        subject, sender, date = _header_values(meta)
+        if probably_not_expense(subject, sender, ''):
+            continue
+        candidates.append((mid, subject, sender, date))
+
+    # Pass 2: full bodies, but only for messages that passed the gate
+    full_msgs = _batch_get_messages(
+        service, [mid for mid, _, _, _ in candidates], format='full'
+    )
 
-    messages = results.get('messages', [])
     emails = []
 
-    for msg in messages:
+    for mid, subject, sender, date in candidates:
         try:
-            # Skip if already processed
-            if email_already_processed(msg['id']):
+            full_msg = full_msgs.get(mid)
+            if not full_msg:
                 continue
 
-            full_msg = service.users().messages().get(
-                userId='me',
-                id=msg['id'],
-                format='full'
-            ).execute()
-
-            headers = full_msg.get('payload', {}).get('headers', [])
-            subject = ""
-            sender = ""
-            date = ""
-
-            for header in headers:
-                name = header.get('name', '').lower()
-                if name == 'subject':
-                    subject = header.get('value', '')
-                elif name == 'from':
-                    sender = header.get('value', '')
-                elif name == 'date':
-                    date = header.get('value', '')
-
             body = extract_email_body(full_msg.get('payload', {}))
 
             # Truncate body for AI processing
@@ -127,7 +227,7 @@ def fetch_new_emails(service, max_results: int = 50) -> List[dict]:
                 body = body[:2000] + "..."
 
             emails.append({
-                'id': msg['id'],
+                'id': mid,
                 'subject': subject,
                 'sender': sender,
                 'body': body,
@@ -137,10 +237,16 @@ def fetch_new_emails(service, max_results: int = 50) -> List[dict]:
         except Exception:
             continue
 
-    return emails
+    if new_history_id is None:
+        # Seed/advance the history cursor from the newest fetched message
+        history_ids = [int(m['historyId']) for m in meta_msgs.values() if m.get('historyId')]
+        if history_ids:
+            new_history_id = str(max(history_ids))
 
+    return emails, new_history_id
 
-def classify_email(subject: str, sender: str, body: str) -> dict:
+
+async def classify_email(subject: str, sender: str, body: str) -> dict:
     """
     Use AI to classify if email is expense-related and extract expense data.
 
@@ -151,12 +257,20 @@ def classify_email(subject: str, sender: str, body: str) -> dict:
             "expense_data": {...} or None
         }
     """
+    # Window the body around the first currency token to keep the prompt
+    # small; fewer input tokens means lower latency and cost per email.
+    m = _AMOUNT_TOKEN.search(body)
+    if m:
+        snippet = body[max(0, m.start() - 300):m.start() + 300]
+    else:
+        snippet = body[:400]
+
     prompt = f"""Analyze this email and determine if it contains information about an expense, purchase, payment, receipt, invoice, or subscription charge.
 
 Email Subject: {subject}
 From: {sender}
 Body:
-{body[:1500]}
+{snippet}
 
 Respond with JSON only:
 {{
@@ -175,23 +289,27 @@ Respond with JSON only:
 
 Only set is_expense to true if there's a clear expense with an amount. Marketing emails, newsletters, and promotional content are NOT expenses."""
 
+    # Re-pulling the same mailbox re-sends identical prompts; serve those
+    # from the on-disk cache instead of paying the API call again.
+    cache_key = hashlib.blake2b(f"gpt-4o-mini|{prompt}".encode()).hexdigest()
+    cached = get_llm_cache(cache_key)
+    if cached is not None:
+        try:
+            return json.loads(cached)
+        except ValueError:
+            pass
+
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.1,
-            max_tokens=500
+            max_tokens=200,
+            response_format={"type": "json_object"}
         )
-        content = response.choices[0].message.content.strip()
-
-        # Clean up JSON
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-        content = content.strip()
-
+        content = response.choices[0].message.content
         result = json.loads(content)
+        put_llm_cache(cache_key, content)
         return result
 
     except Exception as e:
@@ -214,8 +332,10 @@ async def pull_and_process_emails(max_results: int = 50) -> dict:
             "expenses_saved": int
         }
     """
-    service = get_gmail_service()
-    emails = fetch_new_emails(service, max_results)
+    # The Gmail client is synchronous (auth plus batched HTTP); run it in
+    # a worker thread so the event loop keeps serving other chats.
+    service = await asyncio.to_thread(get_gmail_service)
+    emails, history_id = await asyncio.to_thread(fetch_new_emails, service, max_results)
 
     stats = {
         "emails_checked": len(emails),
@@ -223,14 +343,27 @@ async def pull_and_process_emails(max_results: int = 50) -> dict:
         "expenses_saved": 0
     }
 
-    for email in emails:
-        # Classify with AI
-        classification = classify_email(
-            email['subject'],
-            email['sender'],
-            email['body']
-        )
+    # Classify concurrently; each call is a ~1-2s API round-trip, so
+    # gathering turns sum-of-latencies into max-of-latencies per batch.
+    sem = asyncio.Semaphore(CLASSIFY_CONCURRENCY)
+
+    async def classify_one(email):
+        async with sem:
+            return email, await classify_email(
+                email['subject'],
+                email['sender'],
+                email['body']
+            )
+
+    candidates = [
+        e for e in emails
+        if not probably_not_expense(e['subject'], e['sender'], e['body'])
+    ]
+
+    results = await asyncio.gather(*(classify_one(e) for e in candidates))
 
+    to_save = []
+    for email, classification in results:
         if classification.get('is_expense') and classification.get('confidence', 0) >= 0.7:
             stats["expenses_found"] += 1
 
@@ -239,14 +372,16 @@ async def pull_and_process_emails(max_results: int = 50) -> dict:
                 expense_data['source'] = 'gmail'
                 expense_data['email_id'] = email['id']
                 expense_data['notes'] = f"{expense_data.get('notes', '')} [From: {email['sender']}]".strip()
+                to_save.append(expense_data)
 
-                try:
-                    save_expense(expense_data)
-                    stats["expenses_saved"] += 1
-                except Exception:
-                    pass  # Skip duplicates or errors
+    # Flush the whole batch in one transaction instead of one commit per
+    # email; duplicates are skipped inside the insert, not counted
+    stats["expenses_saved"] = save_expenses_bulk(to_save)
 
-    # Update sync timestamp
-    set_sync_state(timestamp=datetime.now(timezone.utc).isoformat())
+    # Update sync cursor (history id for incremental sync, timestamp as fallback)
+    set_sync_state(
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        history_id=history_id
+    )
 
     return stats
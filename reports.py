@@ -1,10 +1,64 @@
 import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, date
-import matplotlib.pyplot as plt
-import pandas as pd
-from db import get_expenses_between, aggregate_by_field, total_spent, get_budgets
+from functools import lru_cache
+from pathlib import Path
+from PIL import Image, ImageDraw, ImageFont
+from db import (
+    DB_PATH, aggregate_by_field, total_spent, get_budget_index,
+    weekly_totals, top_by_field, expenses_version
+)
 
-plt.style.use("seaborn")
+# For the simple bar charts the bot sends, drawing directly with Pillow
+# skips the whole matplotlib pipeline (figure, artist tree, text layout).
+# The matplotlib path is kept behind this flag for parity testing.
+USE_MPL = False
+
+try:
+    _FONT = ImageFont.truetype("DejaVuSans.ttf", 12)
+    _FONT_TITLE = ImageFont.truetype("DejaVuSans.ttf", 16)
+except OSError:
+    _FONT = ImageFont.load_default()
+    _FONT_TITLE = _FONT
+
+# Matplotlib state, created on first use. Importing pyplot costs
+# hundreds of ms (including the font-manager cache scan), so the default
+# Pillow renderer never pays it; the USE_MPL path initializes once and
+# reuses one figure per plot kind, cleared between renders.
+_MPL = None
+_MPL_INIT_LOCK = threading.Lock()
+
+def _mpl_state():
+    global _MPL
+    with _MPL_INIT_LOCK:
+        if _MPL is None:
+            import matplotlib
+            matplotlib.use('Agg')  # headless backend; skips any GUI toolkit init
+            import matplotlib.pyplot as plt
+            # Minimal seaborn-ish look without loading a style sheet
+            # ("seaborn" was also removed as a style name in matplotlib 3.6)
+            plt.rcParams.update({
+                'axes.grid': True,
+                'axes.facecolor': '#EAEAF2',
+                'axes.edgecolor': 'white',
+                'grid.color': 'white',
+                # Name the font explicitly so the font manager never runs
+                # a substitution search, and keep autolayout off: both
+                # plot paths use fixed subplots_adjust margins.
+                'font.family': 'DejaVu Sans',
+                'font.size': 10,
+                'figure.autolayout': False,
+            })
+            _MPL = {
+                'weekly': plt.subplots(figsize=(8,4)),
+                'weekly_lock': threading.Lock(),
+                'vendor': plt.subplots(figsize=(8,4)),
+                'vendor_lock': threading.Lock(),
+            }
+    return _MPL
 
 def iso_first_last_of_month(year: int, month: int):
     first = date(year, month, 1)
@@ -14,73 +68,246 @@ def iso_first_last_of_month(year: int, month: int):
         last = date(year, month + 1, 1) - timedelta(days=1)
     return first.isoformat(), last.isoformat()
 
-def monthly_text_summary(year: int, month: int) -> str:
-    start, end = iso_first_last_of_month(year, month)
-    total = total_spent(start, end)
-    by_cat = aggregate_by_field(start, end, field="category")
-    budgets = {b["category"]: b for b in get_budgets()}
-
-    lines = []
-    lines.append(f"📅 Monthly Report: {date(year, month, 1).strftime('%B %Y')}")
-    lines.append(f"Total spent: {total:.2f}")
-    lines.append("")
-    lines.append("Top categories:")
-    for item in by_cat[:8]:
-        cat = item["field"] or "Uncategorized"
-        total_cat = item["total"]
-        budget = budgets.get(cat)
-        if budget:
-            lines.append(f"• {cat}: {total_cat:.2f} / budget {budget['amount']:.2f}")
-        else:
-            lines.append(f"• {cat}: {total_cat:.2f}")
-    return "\n".join(lines)
-
-def plot_weekly_spend(year:int, month:int):
-    # build dataframe from daily totals for that month
+@lru_cache(maxsize=64)
+def _monthly_bundle(year: int, month: int, version: int):
+    """All DB work for one month's report, cached per data version.
+
+    Rendering a report hits the same (year, month) window several
+    times (summary text + two plots); keying on expenses_version means
+    closed months are effectively cached forever while the current month
+    refreshes on every write.
+    """
     start, end = iso_first_last_of_month(year, month)
-    expenses = get_expenses_between(start, end)
-    if not expenses:
-        return None
+    return (
+        total_spent(start, end),
+        aggregate_by_field(start, end, field="category"),
+        weekly_totals(start, end),
+    )
+
+def monthly_bundle(year: int, month: int):
+    return _monthly_bundle(year, month, expenses_version())
+
+def _category_line(item, budgets) -> str:
+    cat = item["field"] or "Uncategorized"
+    line = f"• {cat}: {item['total']:.2f}"
+    budget = budgets.get(cat)
+    if budget:
+        line += f" / budget {budget['amount']:.2f}"
+    return line
+
+def monthly_text_summary(year: int, month: int) -> str:
+    total, by_cat, _ = monthly_bundle(year, month)
+    budgets = get_budget_index()
 
-    df = pd.DataFrame(expenses)
-    df['date'] = pd.to_datetime(df['date']).dt.date
-    daily = df.groupby('date')['amount'].sum().reset_index()
-    # resample to weekly by summing
-    daily['date'] = pd.to_datetime(daily['date'])
-    weekly = daily.set_index('date').resample('W-MON').sum().reset_index()  # weeks starting Monday
-
-    fig, ax = plt.subplots(figsize=(8,4))
-    ax.bar(weekly['date'].dt.strftime('%Y-%m-%d'), weekly['amount'], color='#2a9d8f')
-    ax.set_title('Weekly spend')
-    ax.set_xlabel('Week starting')
-    ax.set_ylabel('Amount')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
+    header = (
+        f"📅 Monthly Report: {date(year, month, 1).strftime('%B %Y')}\n"
+        f"Total spent: {total:.2f}\n"
+        "\n"
+        "Top categories:\n"
+    )
+    return header + "\n".join(_category_line(item, budgets) for item in by_cat[:8])
+
+def _simple_barchart(labels, values, title, color, horizontal=False) -> io.BytesIO:
+    """Render a bar chart straight to PNG with Pillow."""
+    width, height = 800, 400
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    draw.text((10, 8), title, fill='black', font=_FONT_TITLE)
+
+    left, right, top, bottom = 110, 50, 40, 40
+    plot_w = width - left - right
+    plot_h = height - top - bottom
+    vmax = max(values) if values else 0
+    if vmax <= 0:
+        vmax = 1
+    n = len(values)
+
+    if horizontal:
+        step = plot_h / n
+        bar = max(1, int(step * 0.7))
+        for i, (label, val) in enumerate(zip(labels, values)):
+            y0 = top + int(i * step + (step - bar) / 2)
+            x1 = left + int(plot_w * (val / vmax))
+            draw.rectangle([left, y0, x1, y0 + bar], fill=color)
+            draw.text((6, y0 + bar // 2 - 6), str(label)[:15], fill='black', font=_FONT)
+            draw.text((x1 + 4, y0 + bar // 2 - 6), f"{val:.2f}", fill='black', font=_FONT)
+    else:
+        step = plot_w / n
+        bar = max(1, int(step * 0.6))
+        for i, (label, val) in enumerate(zip(labels, values)):
+            x0 = left + int(i * step + (step - bar) / 2)
+            y0 = top + plot_h - int(plot_h * (val / vmax))
+            draw.rectangle([x0, y0, x0 + bar, top + plot_h], fill=color)
+            draw.text((x0, top + plot_h + 6), str(label), fill='black', font=_FONT)
+            draw.text((x0, y0 - 16), f"{val:.2f}", fill='black', font=_FONT)
+
+    draw.line([left, top, left, top + plot_h], fill='black')
+    draw.line([left, top + plot_h, left + plot_w, top + plot_h], fill='black')
 
     bio = io.BytesIO()
-    fig.savefig(bio, format='png')
-    plt.close(fig)
+    img.save(bio, 'PNG', compress_level=1)
     bio.seek(0)
     return bio
 
-def plot_vendor_top(year:int, month:int, top_n=10):
-    start, end = iso_first_last_of_month(year, month)
-    by_vendor = aggregate_by_field(start, end, field='vendor')
-    if not by_vendor:
+def _encode_png(fig) -> io.BytesIO:
+    """Encode a figure to PNG through a large write buffer.
+
+    The PNG writer issues many small write() calls; a 256 KiB
+    BufferedWriter batches them into a few large writes instead of
+    repeatedly growing the BytesIO.
+    """
+    raw = io.BytesIO()
+    out = io.BufferedWriter(raw, buffer_size=256 * 1024)
+    fig.savefig(out, format='png', pil_kwargs={'compress_level': 3, 'optimize': False})
+    out.flush()
+    out.detach()  # keep raw open
+    raw.seek(0)
+    return raw
+
+def _render_weekly_spend(year:int, month:int):
+    # weekly totals are aggregated in SQL (see db.weekly_totals)
+    _, _, weekly = monthly_bundle(year, month)
+    if not weekly:
         return None
-    df = pd.DataFrame(by_vendor)
-    df = df[df['field'] != None]
-    if df.empty:
+
+    if not USE_MPL:
+        return _simple_barchart(
+            [w['week_start'] for w in weekly],
+            [w['total'] for w in weekly],
+            'Weekly spend', '#2a9d8f'
+        )
+
+    labels = [w['week_start'] for w in weekly]
+    mpl = _mpl_state()
+    with mpl['weekly_lock']:
+        fig, ax = mpl['weekly']
+        ax.clear()
+        ax.bar(range(len(weekly)), [w['total'] for w in weekly], color='#2a9d8f')
+        ax.set_title('Weekly spend')
+        ax.set_xlabel('Week starting')
+        ax.set_ylabel('Amount')
+        # Explicit tick positions plus fixed margins; tight_layout would
+        # re-render the figure twice just to measure the rotated labels.
+        ax.set_xticks(range(len(weekly)))
+        ax.set_xticklabels(labels, rotation=45, ha='right')
+        fig.subplots_adjust(bottom=0.25, left=0.1, right=0.98, top=0.9)
+
+        bio = _encode_png(fig)
+    return bio
+
+def _render_vendor_top(year:int, month:int, top_n=10):
+    # top N computed in SQL (ORDER BY total DESC LIMIT) instead of
+    # aggregating every vendor and slicing here
+    start, end = iso_first_last_of_month(year, month)
+    rows = [(r['field'], r['total']) for r in top_by_field(start, end, 'vendor', top_n)]
+    if not rows:
         return None
-    df = df.head(top_n)
-    fig, ax = plt.subplots(figsize=(8,4))
-    ax.barh(df['field'][::-1], df['total'][::-1], color='#e76f51')
-    ax.set_title('Top vendors')
-    ax.set_xlabel('Amount')
-    plt.tight_layout()
-    bio = io.BytesIO()
-    fig.savefig(bio, format='png')
-    plt.close(fig)
-    bio.seek(0)
+    if not USE_MPL:
+        return _simple_barchart(
+            [r[0] for r in rows], [r[1] for r in rows],
+            'Top vendors', '#e76f51', horizontal=True
+        )
+
+    labels, vals = zip(*reversed(rows))
+    mpl = _mpl_state()
+    with mpl['vendor_lock']:
+        fig, ax = mpl['vendor']
+        ax.clear()
+        ax.barh(labels, vals, color='#e76f51')
+        ax.set_title('Top vendors')
+        ax.set_xlabel('Amount')
+        fig.subplots_adjust(left=0.25, right=0.98, top=0.9, bottom=0.12)
+        bio = _encode_png(fig)
     return bio
 
+
+# Rendered PNGs for months strictly before the current one never change,
+# so their bytes are cached in memory and mirrored on disk across
+# restarts (trusted only if newer than the database file).
+_PNG_CACHE = OrderedDict()
+_PNG_CACHE_MAX = 256
+_PNG_CACHE_DIR = Path.home() / '.cache' / 'tacanno' / 'plots'
+
+def _is_closed_month(year: int, month: int) -> bool:
+    today = date.today()
+    return (year, month) < (today.year, today.month)
+
+def _plot_cache_path(kind: str, year: int, month: int) -> Path:
+    return _PNG_CACHE_DIR / f"{year}-{month:02d}-{kind}.png"
+
+def _db_mtime() -> float:
+    """Last write time of the database, WAL-aware.
+
+    In WAL mode writes land in the -wal file and the main file's mtime
+    only moves on checkpoint, so take the newer of the two.
+    """
+    mtime = os.path.getmtime(DB_PATH)
+    try:
+        mtime = max(mtime, os.path.getmtime(DB_PATH + '-wal'))
+    except OSError:
+        pass
+    return mtime
+
+def _load_plot_from_disk(kind: str, year: int, month: int):
+    path = _plot_cache_path(kind, year, month)
+    try:
+        if path.stat().st_mtime >= _db_mtime():
+            return path.read_bytes()
+    except OSError:
+        pass
+    return None
+
+def _store_plot_to_disk(kind: str, year: int, month: int, data: bytes):
+    try:
+        _PNG_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _plot_cache_path(kind, year, month).write_bytes(data)
+    except OSError:
+        pass
+
+def _cached_plot(kind: str, year: int, month: int, render):
+    """Serve a plot from the closed-month PNG cache, rendering on miss."""
+    if not _is_closed_month(year, month):
+        return render()
+
+    # Keyed on expenses_version so a backfilled expense in a past month
+    # invalidates the cached bytes instead of serving a stale chart
+    key = (kind, year, month, expenses_version())
+    data = _PNG_CACHE.get(key)
+    if data is None:
+        data = _load_plot_from_disk(kind, year, month)
+    if data is None:
+        bio = render()
+        if bio is None:
+            return None
+        data = bio.getvalue()
+        _store_plot_to_disk(kind, year, month, data)
+
+    _PNG_CACHE[key] = data
+    _PNG_CACHE.move_to_end(key)
+    while len(_PNG_CACHE) > _PNG_CACHE_MAX:
+        _PNG_CACHE.popitem(last=False)
+    return io.BytesIO(data)
+
+def plot_weekly_spend(year: int, month: int):
+    return _cached_plot('weekly', year, month,
+                        lambda: _render_weekly_spend(year, month))
+
+def plot_vendor_top(year: int, month: int, top_n=10):
+    return _cached_plot(f'vendor-top{top_n}', year, month,
+                        lambda: _render_vendor_top(year, month, top_n))
+
+
+# Both plots are independent and CPU-bound; two workers roughly halve
+# the wall time of a full report render.
+_PLOT_POOL = ThreadPoolExecutor(max_workers=2)
+
+def build_monthly_report(year: int, month: int):
+    """Text summary plus both charts, plots rendered in parallel.
+
+    Returns (text, weekly_bio, vendor_bio); the chart buffers are None
+    for months without data.
+    """
+    weekly_future = _PLOT_POOL.submit(plot_weekly_spend, year, month)
+    vendor_future = _PLOT_POOL.submit(plot_vendor_top, year, month, 10)
+    text = monthly_text_summary(year, month)
+    return text, weekly_future.result(), vendor_future.result()